@@ -29,8 +29,13 @@ from matplotlib.ticker import FuncFormatter
 import matplotlib.dates as mdt
 import seaborn as sns
 
+# Timing and memory of the heavier steps (enable with STOCK_TRACE=1)
+from instrumentation import span, tracer
+
 # Import the data set
-dataset = yf.download('BAC', start='2004-01-01', end='2016-01-01')
+with span('download') as timing:
+  dataset = yf.download('BAC', start='2004-01-01', end='2016-01-01')
+  timing.rows = len(dataset)
 
 # Read the data set
 dataset
@@ -162,7 +167,8 @@ However, note that this test actually do not test whether the data have any tren
 dataset_columns = dataset.iloc[:, 1:7].columns
 
 for i in dataset_columns:
-  result = adfuller(dataset[i])
+  with span(f'adf_{i}', rows=len(dataset)):
+    result = adfuller(dataset[i])
   print(i)
   # Specify the float precision of ADF statistic
   print(f'ADF Statistic: {result[0]:.6f}')
@@ -474,7 +480,8 @@ def make_growth_dataframe(input):
   return growth_data
 
 # Make growth data set first
-growth_dataframe = make_growth_dataframe(input=dataset.iloc[:, 1:7])
+with span('growth', rows=len(dataset)):
+  growth_dataframe = make_growth_dataframe(input=dataset.iloc[:, 1:7])
 dataset = pd.concat([dataset, growth_dataframe], axis=1)
 dataset
 
@@ -646,3 +653,7 @@ customize_graph(input=yearly_2015_dataset)
 
 There are also a story that I didn't show yet: 2-in-1 stock split in 2004. Although no significant effects, compared to 2008 economic recession, surely it has an impact (particularly monthly impact), though.
 """
+
+# Write the timings of this run, so batch runs can be compared with each other
+if tracer.enabled:
+  tracer.write_json('analysis_trace.json', ticker='BAC')
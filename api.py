@@ -0,0 +1,298 @@
+'''
+    Read-only HTTP API over the project's computations, for services that cannot use the Streamlit UI.
+
+    Endpoints (all GET, all take ?ticker=..., ranges are ?start=YYYY-MM-DD&end=YYYY-MM-DD):
+    - /tickers                          tickers, columns and date ranges that are loaded
+    - /metrics?column=Close             min/max (with their dates), average and standard deviation, as in the dashboard
+    - /series?column=Close_Growth       the series in the range, downsampled to ?points=N buckets (default 500)
+    - /summary                          describe(), skewness and kurtosis of every column
+    - /correlation                      correlation matrix of every column
+
+    Responses are JSON by default. With ?format=arrow, or an Accept header of application/vnd.apache.arrow.stream,
+    the same table is sent as a compact Arrow IPC stream.
+
+    Every response is kept in an LRU cache keyed by (endpoint, ticker, column, range, other params, format),
+    and carries an ETag. A client sending If-None-Match with that ETag gets an empty 304 back.
+
+    Example:
+        python api.py --dataset BAC=dataset_full.csv --port 8080
+        curl 'localhost:8080/metrics?ticker=BAC&column=Close&start=2008-01-01&end=2010-12-31'
+'''
+
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+from pipeline import make_growth_dataframe
+from streaming import PRICE_COLUMNS
+
+
+ARROW_TYPE = 'application/vnd.apache.arrow.stream'
+JSON_TYPE = 'application/json'
+
+
+class ResponseCache:
+    '''
+        LRU cache of encoded responses: key -> (body, content type, etag).
+        Encoding is part of what is cached, so a hit costs no pandas work at all.
+    '''
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+def load_dataset(path):
+    # Same reading as the dashboard. Growth columns are added if the file only has prices
+    data = pd.read_csv(path, parse_dates=['Date']).sort_values('Date', kind='stable').reset_index(drop=True)
+    if not all(column + '_Growth' in data.columns for column in PRICE_COLUMNS):
+        data = pd.concat([data[['Date'] + PRICE_COLUMNS], make_growth_dataframe(data)], axis=1)
+    return data
+
+
+def select_range(data, start, end):
+    '''
+        Rows between start and end (both included). The data is sorted by date, so two binary searches
+        find the slice, instead of a boolean scan like data['Date'].between(...).
+    '''
+    dates = data['Date'].values
+    first = np.searchsorted(dates, np.datetime64(start), side='left') if start is not None else 0
+    last = np.searchsorted(dates, np.datetime64(end), side='right') if end is not None else len(dates)
+    return data.iloc[first:last]
+
+
+def range_metrics(data, column):
+    '''
+        The metric cards of the dashboard: minimum and maximum (with the first date they happen),
+        average and standard deviation (pandas std, with Bessel correction).
+    '''
+    values = data[column].dropna()
+    if not len(values):
+        raise bad_request(f'No {column} values in this range', web.HTTPNotFound)
+    return pd.DataFrame([{
+        'column': column,
+        'rows': len(values),
+        'min': values.min(),
+        'min_date': data['Date'].loc[values.idxmin()],
+        'max': values.max(),
+        'max_date': data['Date'].loc[values.idxmax()],
+        'mean': values.mean(),
+        'std': values.std(),
+    }])
+
+
+def downsample(data, column, points, how):
+    '''
+        Split the range into `points` buckets of consecutive rows. Each bucket keeps its first date and
+        either the mean, the last value, or both the min and max of the column ('minmax', so spikes
+        like the 2009 volume boom are still visible on a small chart).
+    '''
+    frame = data[['Date', column]].reset_index(drop=True)
+    if len(frame) <= points:
+        # Nothing to merge, but the columns stay the same as for a longer range
+        if how == 'minmax':
+            return pd.DataFrame({'Date': frame['Date'], 'min': frame[column], 'max': frame[column]})
+        return frame
+
+    buckets = np.arange(len(frame)) * points // len(frame)
+    grouped = frame.groupby(buckets)
+    if how == 'mean':
+        return grouped.agg(Date=('Date', 'first'), value=(column, 'mean')).rename(columns={'value': column})
+    if how == 'last':
+        return grouped.agg(Date=('Date', 'first'), value=(column, 'last')).rename(columns={'value': column})
+    return grouped.agg(Date=('Date', 'first'), min=(column, 'min'), max=(column, 'max'))
+
+
+def summary_statistics(data):
+    numeric = data.drop(columns=['Date'])
+    summary = numeric.describe().T
+    summary['skewness'] = numeric.skew()
+    summary['kurtosis'] = numeric.kurtosis()
+    return summary.rename_axis('column').reset_index()
+
+
+def encode(frame, fmt):
+    if fmt == 'arrow':
+        import pyarrow as pa
+
+        table = pa.Table.from_pandas(frame, preserve_index=False)
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue(), ARROW_TYPE
+    body = frame.to_json(orient='records', date_format='iso', double_precision=6)
+    return body.encode(), JSON_TYPE
+
+
+def bad_request(message, error=web.HTTPBadRequest):
+    return error(text=json.dumps({'error': message}), content_type=JSON_TYPE)
+
+
+def parse_date(value, name):
+    if value is None:
+        return None
+    try:
+        date = pd.Timestamp(value)
+    except ValueError:
+        raise bad_request(f'{name} is not a date: {value!r}')
+    # An empty value parses as NaT instead of failing
+    if pd.isna(date):
+        raise bad_request(f'{name} is not a date: {value!r}')
+    return date.to_datetime64()
+
+
+def build_entry(compute, data, column, query, fmt):
+    # One cache entry: run the computation, encode it and tag it
+    frame = compute(data, column, query)
+    body, content_type = encode(frame, fmt)
+    etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+    return body, content_type, etag
+
+
+def endpoint(compute, uses_column=False, extra_params=()):
+    '''
+        Wraps a computation into a cached handler. compute(data, column, query) returns a data frame,
+        this wrapper takes care of the parameters, the cache, the encoding and the ETag.
+        On a cache miss the pandas work runs in a worker thread, so the event loop keeps
+        answering other requests (cache hits, 304s) meanwhile.
+    '''
+    async def handler(request):
+        query = request.query
+        datasets = request.app['datasets']
+
+        ticker = query.get('ticker', next(iter(datasets)))
+        if ticker not in datasets:
+            raise bad_request(f'Unknown ticker: {ticker!r}', web.HTTPNotFound)
+        data = datasets[ticker]
+
+        column = query.get('column') if uses_column else None
+        if uses_column and not column:
+            raise bad_request('column is required')
+        if uses_column and column not in data.columns:
+            raise bad_request(f'Unknown column: {column!r}', web.HTTPNotFound)
+
+        start = parse_date(query.get('start'), 'start')
+        end = parse_date(query.get('end'), 'end')
+        fmt = 'arrow' if query.get('format') == 'arrow' or ARROW_TYPE in request.headers.get('Accept', '') else 'json'
+        params = tuple((name, query.get(name)) for name in extra_params)
+
+        key = (request.path, ticker, column, start, end, params, fmt)
+        cache = request.app['cache']
+        entry = cache.get(key)
+        if entry is None:
+            entry = await asyncio.get_running_loop().run_in_executor(
+                None, build_entry, compute, select_range(data, start, end), column, query, fmt)
+            cache.put(key, entry)
+
+        body, content_type, etag = entry
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept'}
+        if_none_match = request.headers.get('If-None-Match', '')
+        # If-None-Match uses the weak comparison, so W/"..." validators match too
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        if etag in tags or if_none_match.strip() == '*':
+            return web.Response(status=304, headers=headers)
+        return web.Response(body=body, content_type=content_type, headers=headers)
+
+    return handler
+
+
+def compute_metrics(data, column, query):
+    return range_metrics(data, column)
+
+
+def compute_series(data, column, query):
+    try:
+        points = int(query.get('points', 500))
+    except ValueError:
+        raise bad_request('points has to be an integer')
+    how = query.get('how', 'mean')
+    if points < 1 or how not in ('mean', 'last', 'minmax'):
+        raise bad_request('points has to be positive and how one of mean, last, minmax')
+    return downsample(data, column, points, how)
+
+
+def compute_summary(data, column, query):
+    return summary_statistics(data)
+
+
+def compute_correlation(data, column, query):
+    return data.drop(columns=['Date']).corr().rename_axis('column').reset_index()
+
+
+async def list_tickers(request):
+    tickers = [{'ticker': ticker,
+                'rows': len(data),
+                'columns': [column for column in data.columns if column != 'Date'],
+                'min_date': data['Date'].iloc[0].strftime('%Y-%m-%d'),
+                'max_date': data['Date'].iloc[-1].strftime('%Y-%m-%d')}
+               for ticker, data in request.app['datasets'].items()]
+    return web.json_response(tickers)
+
+
+async def cache_stats(request):
+    cache = request.app['cache']
+    return web.json_response({'entries': len(cache.entries), 'max_size': cache.max_size,
+                              'hits': cache.hits, 'misses': cache.misses})
+
+
+def create_app(datasets, cache_size=1024):
+    '''
+        datasets maps a ticker to its data frame (see load_dataset()). Everything is read-only:
+        the data frames are never modified after the app is created.
+    '''
+    # The first ticker is the default one, so there has to be at least one
+    if not datasets:
+        raise ValueError('create_app() needs at least one dataset')
+    app = web.Application()
+    app['datasets'] = datasets
+    app['cache'] = ResponseCache(cache_size)
+    app.router.add_get('/tickers', list_tickers)
+    app.router.add_get('/metrics', endpoint(compute_metrics, uses_column=True))
+    app.router.add_get('/series', endpoint(compute_series, uses_column=True, extra_params=('points', 'how')))
+    app.router.add_get('/summary', endpoint(compute_summary))
+    app.router.add_get('/correlation', endpoint(compute_correlation))
+    app.router.add_get('/cache', cache_stats)
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the stock market analysis over HTTP')
+    parser.add_argument('--dataset', action='append', default=[],
+                        help='TICKER=path.csv, can be repeated (default: BAC=dataset_full.csv)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--cache-size', type=int, default=1024)
+    args = parser.parse_args()
+
+    datasets = {}
+    for item in args.dataset or ['BAC=dataset_full.csv']:
+        ticker, _, path = item.partition('=')
+        if not path:
+            parser.error(f'--dataset has to look like TICKER=path.csv, got {item!r}')
+        datasets[ticker] = load_dataset(path)
+
+    web.run_app(create_app(datasets, args.cache_size), host=args.host, port=args.port)
@@ -1,6 +1,9 @@
 import streamlit as st
 
 # For data wrangling
+import json
+import queue
+import threading
 import datetime as dt
 import pandas as pd
 from datetime import datetime
@@ -10,6 +13,15 @@ import seaborn as sns
 import plotly.graph_objects as go
 import plotly.express as px
 
+# For screening conditions across the data set
+from screener import Screener, parse_conditions
+
+# For timing the hot paths of each rerun
+from instrumentation import Tracer
+
+# For streaming new bars into the dashboard
+from streaming import IngestionService, PRICE_COLUMNS, DEFAULT_TICKER, replay_csv
+
 # Config the page identity
 st.set_page_config(
                    page_title='Stock Market Dashboard',
@@ -24,6 +36,47 @@ st.set_page_config(
 
 st.title('Stock Market Dashboard: BAC 2004-2015 Case 📊')
 
+# The screener indexes are built once per uploaded file, not on every rerun. The cache is keyed on the
+# upload's file id (the leading underscore stops Streamlit from hashing the whole data frame), and only
+# the most recent uploads are kept, since every screener holds a copy of its data and its indexes
+@st.cache_resource(max_entries=4)
+def load_screener(file_id, _data):
+  return Screener(_data)
+
+# One ingestion service per process, shared by every open session
+@st.cache_resource
+def live_services():
+  # Sessions run in their own threads, the lock keeps them from starting two services at once
+  return threading.Lock(), {}
+
+def load_live_service(path, bars_per_second):
+  # A new replay speed replaces the running service instead of starting one more replay thread
+  lock, services = live_services()
+  with lock:
+    current = services.get(path)
+    if current is None or current[0] != bars_per_second:
+      if current is not None:
+        current[1].stop()
+      service = IngestionService(replay_csv(path, bars_per_second))
+      service.start_in_thread()
+      services[path] = (bars_per_second, service)
+    return services[path][1]
+
+# Each session keeps its own tracer, so timings of other users' reruns do not mix in
+tracer = st.session_state.setdefault('tracer', Tracer())
+tracer.reset()
+
+with st.sidebar:
+  live_mode = st.toggle('Live monitoring', help='Replay dataset_full.csv as a stream of new bars')
+  if live_mode:
+    live_speed = st.number_input('Bars per second', min_value=1, max_value=1000, value=20)
+    live_column = st.selectbox('Live column', PRICE_COLUMNS, index=PRICE_COLUMNS.index('Close'))
+
+  if st.toggle('Record timings', help='Measure wall time, CPU time and rows of each step in this rerun'):
+    tracer.enable(memory=st.checkbox('Track peak memory', help='Uses tracemalloc, which slows the rerun down'))
+  else:
+    tracer.disable()
+
 uploaded_file = st.file_uploader("Upload your file here",
                                      type="csv",
                                      help="The file will be used as an input for doing dashboard")
@@ -33,8 +86,10 @@ if uploaded_file is not None:
 
   # If the file exists, show the raw data and ...
     # ... show the properties (dashboard, sliders, )
-  data = pd.read_csv(uploaded_file, 
-                     parse_dates=['Date'])
+  with tracer.span('read_csv') as timing:
+    data = pd.read_csv(uploaded_file, 
+                       parse_dates=['Date'])
+    timing.rows = len(data)
   st.write('You can check the data')
   st.write(data)
 
@@ -62,17 +117,21 @@ if uploaded_file is not None:
                                        data.columns)
             
       # For slider-validated data                                )
-      selected_data = data[data['Date'].between(select_date_slider[0], select_date_slider[1])]
+      with tracer.span('between_filter') as timing:
+        selected_data = data[data['Date'].between(select_date_slider[0], select_date_slider[1])]
+        timing.rows = len(selected_data)
 
-      fig1 = px.line(selected_data,
-              x='Date',
-              y=selectbox_column)
+      with tracer.span('figure_build', rows=len(selected_data)):
+        fig1 = px.line(selected_data,
+                x='Date',
+                y=selectbox_column)
 
-      st.plotly_chart(fig1, use_container_width=True)
+      with tracer.span('figure_render'):
+        st.plotly_chart(fig1, use_container_width=True)
     else:
       st.write('Dashboard cannot be loaded, please upload the data first')
 
-  with col2:
+  with col2, tracer.span('metrics', rows=len(selected_data)):
       # Divided onto two section for wide-wise dashboard view
       # The col2 contains metrics which is placed in each subcol
       subcol1, subcol2 = st.columns(2)
@@ -114,5 +173,120 @@ if uploaded_file is not None:
                   delta=None
                   )
 
+  st.write('---'*5)
+
+  st.markdown('# Screener Section')
+  st.markdown('#### Filter the rows by **several conditions at once**, e.g. `Volume_Growth > 50 and Close_Growth < -5 and Date between 2008 and 2010`')
+
+  with tracer.span('screener_index'):
+    screener = load_screener(uploaded_file.file_id, data)
+
+  with st.expander('Filter panel', expanded=True):
+    # Conditions from the sliders are combined with the typed screen below
+    screen_columns = st.multiselect('Select columns to screen',
+                                    data.select_dtypes('number').columns)
+    conditions = []
+    for column in screen_columns:
+      lowest, highest = float(data[column].min()), float(data[column].max())
+      screen_range = st.slider(f'{column} range',
+                               lowest,
+                               highest,
+                               (lowest, highest))
+      conditions.append((column, 'between', screen_range))
+
+    screen_text = st.text_input('Or type the screen here',
+                                help='Clauses are joined with "and". Wrap column names with spaces in backticks, e.g. `Adj Close_Growth` < -5')
+
+  try:
+    with tracer.span('screen') as timing:
+      screened_ids = screener.row_ids(conditions + (parse_conditions(screen_text) if screen_text else []))
+      timing.rows = len(screened_ids)
+    st.write(f'**{len(screened_ids)}** rows match the screen')
+    st.write(data.iloc[screened_ids])
+  except (ValueError, KeyError) as error:
+    st.write(f'The screen cannot be used: {error}')
+
 else:
-  st.markdown('**Before continue to dashboard, please upload the data set first :D**')
\ No newline at end of file
+  st.markdown('**Before continue to dashboard, please upload the data set first :D**')
+
+# Timing panel goes last, so every span of this rerun is already recorded
+if tracer.enabled:
+  with st.sidebar.expander('Timings of this rerun', expanded=False):
+    st.dataframe(pd.DataFrame(tracer.summary()), hide_index=True)
+    st.download_button('Download JSON trace',
+                       data=json.dumps(tracer.trace(source='dashboard'), indent=2, default=str),
+                       file_name='dashboard_trace.json',
+                       mime='application/json')
+
+# Live section goes at the very end: it keeps updating the page until the next rerun
+if live_mode:
+  st.write('---'*5)
+  st.markdown('# Live Section')
+  st.markdown('#### New bars are **appended** to the chart and metrics without reloading the history')
+
+  service = load_live_service('dataset_full.csv', live_speed)
+
+  # Each session subscribes once, later reruns keep reading the same queue
+  if st.session_state.get('live_service') is not service:
+    if 'live_deltas' in st.session_state:
+      st.session_state['live_service'].unsubscribe(st.session_state['live_deltas'])
+    st.session_state['live_service'] = service
+    st.session_state['live_deltas'] = service.subscribe()
+  deltas = st.session_state['live_deltas']
+
+  # Deltas queued before this rerun are already part of the snapshot below
+  while not deltas.empty():
+    deltas.get_nowait()
+  snapshot = service.frame()
+
+  live_chart = st.line_chart(snapshot.set_index('Date')[[live_column]])
+  live_col1, live_col2, live_col3, live_col4 = st.columns(4)
+  live_cards = [live_col1.empty(), live_col2.empty(), live_col3.empty(), live_col4.empty()]
+
+  def show_live_metrics(metrics):
+    if metrics is None:
+      return
+    live_cards[0].metric(label='Minimum Value', value=round(metrics['min'], 2),
+                         help=f"on {metrics['min_date']:%Y-%m-%d}")
+    live_cards[1].metric(label='Maximum Value', value=round(metrics['max'], 2),
+                         help=f"on {metrics['max_date']:%Y-%m-%d}")
+    live_cards[2].metric(label='Average', value=round(metrics['mean'], 2))
+    live_cards[3].metric(label='Standard Deviation', value=round(metrics['std'], 2))
+
+  show_live_metrics(service.metrics(DEFAULT_TICKER, live_column))
+
+  # The screen is run again on every delta, so bars that match show up as they arrive
+  live_screen = st.text_input('Screen the live bars',
+                              help='Same syntax as the Screener Section, e.g. Volume_Growth > 50 and Close_Growth < -5')
+  live_matches = st.empty()
+
+  def show_live_matches():
+    if not live_screen:
+      return
+    try:
+      matches = service.select(live_screen)
+    except (ValueError, KeyError) as error:
+      live_matches.write(f'The screen cannot be used: {error}')
+      return
+    with live_matches.container():
+      st.write(f'**{len(matches)}** bars match the screen, the latest ones:')
+      st.write(matches.tail(10))
+
+  show_live_matches()
+
+  while not service.done or not deltas.empty():
+    try:
+      delta = deltas.get(timeout=1.0)
+    except queue.Empty:
+      continue
+    # Rows flushed between draining the queue and taking the snapshot are already on the chart
+    if delta['n_rows'] <= len(snapshot):
+      continue
+    live_chart.add_rows(delta['rows'].set_index('Date')[[live_column]])
+    show_live_metrics(delta['aggregates'].get(DEFAULT_TICKER, {}).get(live_column))
+    show_live_matches()
+
+  if service is live_services()[1]['dataset_full.csv'][1]:
+    st.write('The replay has finished')
+  else:
+    st.write('The replay speed has changed, rerun the page to follow the new replay')
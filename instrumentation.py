@@ -0,0 +1,271 @@
+'''
+    Lightweight timing and memory instrumentation for the hot paths (CSV parse, date filter,
+    metrics, figure build, growth computation, ADF runs, ...).
+
+    A span measures one block of code: wall time, CPU time, peak memory (tracemalloc) and,
+    optionally, how many rows were processed. Spans can be used as a context manager or a decorator:
+
+        with span('read_csv') as s:
+            data = pd.read_csv(path)
+            s.rows = len(data)
+
+        @traced('growth')
+        def make_growth_dataframe(input): ...
+
+    Instrumentation is off by default. When it is off, span() hands back one shared do-nothing object,
+    so the cost is a single function call. Turn it on with enable() or with the STOCK_TRACE=1
+    environment variable (STOCK_TRACE_MEMORY=1 also tracks peak memory, which is slower).
+
+    Peak memory is process-wide, so only one tracer at a time can measure it. When spans of several
+    tracers overlap (e.g. two dashboard sessions), the later ones record peak_kb as None instead of a
+    number that another tracer's spans have reset.
+'''
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from datetime import datetime
+
+
+class Span:
+    def __init__(self, tracer, name, rows=None):
+        self.tracer = tracer
+        self.name = name
+        self.rows = rows
+        self.depth = 0
+        self.child_peak = 0
+        self.measure_memory = False
+
+    def __enter__(self):
+        tracer = self.tracer
+        self.depth = len(tracer.stack)
+        tracer.stack.append(self)
+
+        if tracer.memory:
+            # A top level span has to own the peak first, nested spans measure when their parent does
+            self.measure_memory = tracer.stack[-2].measure_memory if self.depth else claim_memory(tracer)
+
+        if self.measure_memory:
+            # tracemalloc only has one global peak. Resetting it here would hide the outer span's
+            # peak so far, so the outer span remembers it before the reset
+            current, peak = tracemalloc.get_traced_memory()
+            if self.depth:
+                parent = tracer.stack[-2]
+                parent.child_peak = max(parent.child_peak, peak)
+            self.start_memory = current
+            tracemalloc.reset_peak()
+
+        self.started_at = time.time()
+        self.start_cpu = time.process_time()
+        self.start_wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.process_time() - self.start_cpu
+        tracer = self.tracer
+        tracer.stack.pop()
+
+        record = {
+            'name': self.name,
+            'depth': self.depth,
+            'started_at': self.started_at,
+            'wall_ms': round(wall * 1000, 3),
+            'cpu_ms': round(cpu * 1000, 3),
+            'rows': self.rows,
+            'error': exc_type.__name__ if exc_type is not None else None,
+        }
+
+        if self.measure_memory:
+            peak = max(tracemalloc.get_traced_memory()[1], self.child_peak)
+            record['peak_kb'] = round((peak - self.start_memory) / 1024, 1)
+            if tracer.stack:
+                parent = tracer.stack[-1]
+                parent.child_peak = max(parent.child_peak, peak)
+            else:
+                release_memory(tracer)
+        elif tracer.memory:
+            # Another tracer owned the peak for (part of) this span, so it cannot be measured
+            record['peak_kb'] = None
+
+        tracer.records.append(record)
+        return False
+
+
+class NullSpan:
+    '''
+        Stand-in used while instrumentation is disabled. Setting rows on it is harmless.
+    '''
+    rows = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+# tracemalloc is process-wide, while tracers are not (the dashboard has one per session).
+# It is started by the first tracer that tracks memory and only stopped once the last one stops.
+# Its peak is process-wide too: memory_owner is the tracer whose top level span is measuring it
+memory_users = 0
+memory_lock = threading.Lock()
+memory_started_here = False
+memory_owner = None
+
+
+def claim_memory(tracer):
+    global memory_owner
+    with memory_lock:
+        if memory_owner is None:
+            memory_owner = tracer
+        return memory_owner is tracer
+
+
+def release_memory(tracer):
+    global memory_owner
+    with memory_lock:
+        if memory_owner is tracer:
+            memory_owner = None
+
+
+def start_memory_tracking():
+    global memory_users, memory_started_here
+    with memory_lock:
+        if memory_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            memory_started_here = True
+        memory_users += 1
+
+
+def stop_memory_tracking():
+    global memory_users, memory_started_here
+    with memory_lock:
+        memory_users -= 1
+        # Tracing started by someone else (e.g. python -X tracemalloc) is left alone
+        if memory_users == 0 and memory_started_here:
+            tracemalloc.stop()
+            memory_started_here = False
+
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.records = []
+        self.stack = []
+        self.memory_release = None
+
+    def enable(self, memory=False):
+        if memory and not self.memory:
+            start_memory_tracking()
+            # A dashboard session can close without disabling its tracer, release it when it is collected
+            self.memory_release = weakref.finalize(self, stop_memory_tracking)
+        elif self.memory and not memory:
+            self.memory_release()
+        self.enabled = True
+        self.memory = memory
+
+    def disable(self):
+        if self.memory:
+            self.memory_release()
+        self.enabled = False
+        self.memory = False
+
+    def reset(self):
+        self.records = []
+        self.stack = []
+
+    def span(self, name, rows=None):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, rows)
+
+    def summary(self):
+        '''
+            Aggregate the records per span name: how many times it ran, total and worst wall time.
+            This is what the dashboard shows, the raw records are what goes into the JSON trace.
+        '''
+        summary = {}
+        for record in self.records:
+            entry = summary.setdefault(record['name'], {'name': record['name'], 'calls': 0,
+                                                        'wall_ms': 0.0, 'max_wall_ms': 0.0,
+                                                        'cpu_ms': 0.0, 'rows': 0})
+            entry['calls'] += 1
+            entry['wall_ms'] = round(entry['wall_ms'] + record['wall_ms'], 3)
+            entry['max_wall_ms'] = max(entry['max_wall_ms'], record['wall_ms'])
+            entry['cpu_ms'] = round(entry['cpu_ms'] + record['cpu_ms'], 3)
+            entry['rows'] += record['rows'] or 0
+            if 'peak_kb' in record:
+                # None when no call of this span could be measured
+                peaks = [peak for peak in (entry.get('peak_kb'), record['peak_kb']) if peak is not None]
+                entry['peak_kb'] = max(peaks) if peaks else None
+        return list(summary.values())
+
+    def trace(self, **metadata):
+        return {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'pid': os.getpid(),
+            'metadata': metadata,
+            'summary': self.summary(),
+            'spans': self.records,
+        }
+
+    def write_json(self, path, **metadata):
+        with open(path, 'w') as file:
+            json.dump(self.trace(**metadata), file, indent=2, default=str)
+        return path
+
+
+# Default tracer of the process, used by span() and traced() (e.g. in the analysis script).
+# The dashboard and the pipeline shards create their own Tracer instead
+tracer = Tracer()
+
+if os.environ.get('STOCK_TRACE') == '1':
+    tracer.enable(memory=os.environ.get('STOCK_TRACE_MEMORY') == '1')
+
+
+def enable(memory=False):
+    tracer.enable(memory=memory)
+
+
+def disable():
+    tracer.disable()
+
+
+def span(name, rows=None):
+    return tracer.span(name, rows)
+
+
+def traced(name=None):
+    '''
+        Decorator version of span(). Works both as @traced and @traced('name').
+        If the function returns something with a shape (a data frame or an array),
+        the number of rows is recorded as well.
+    '''
+    def decorate(function, label):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+            with tracer.span(label) as current:
+                result = function(*args, **kwargs)
+                shape = getattr(result, 'shape', None)
+                if shape:
+                    current.rows = shape[0]
+                return result
+        return wrapper
+
+    if callable(name):
+        return decorate(name, name.__qualname__)
+    return lambda function: decorate(function, name or function.__qualname__)
@@ -0,0 +1,358 @@
+'''
+    Batch runner for the full analysis (the same steps as analyzing_stock_market_project.py) across many tickers.
+
+    The notebook is linear and made for one ticker: any failure means starting over. Here, the universe
+    is sharded by ticker across a process pool, and every stage is a cached step:
+    1. The key of a stage is a hash of its name, its version, its parameters and the content hash
+       of the outputs it reads. If none of them changed, the stage is skipped and its checkpoint is loaded.
+    2. Checkpoints are pickles on disk (cache_dir/<ticker>/<stage>-<key>.pkl), written atomically,
+       so a crashed run never leaves a half-written checkpoint behind.
+    3. A failed shard is recorded in the manifest. Running the same command again (or with --only-failed)
+       resumes it: the stages that already finished are loaded from their checkpoints.
+
+    Example:
+        python pipeline.py --tickers BAC JPM C --workers 8
+        python pipeline.py --universe tickers.txt --csv-dir data/ --only-failed
+'''
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import traceback
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import Tracer
+from streaming import PRICE_COLUMNS
+
+
+# Bump a stage's version when its code changes, so old checkpoints are not reused.
+# writes_files marks stages whose output is a list of files (charts): they only count as cached
+# while those files still exist
+Stage = namedtuple('Stage', ['name', 'inputs', 'function', 'version', 'writes_files'], defaults=[False])
+
+
+def content_hash(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        # Hash of the values and the index, independent of how pickle lays the object out
+        digest = hashlib.sha256(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        columns = value.columns if isinstance(value, pd.DataFrame) else [value.name]
+        digest.update(repr(list(columns)).encode())
+        return digest.hexdigest()
+    return hashlib.sha256(pickle.dumps(value)).hexdigest()
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ----------------------------------------------------------------------------------------------------
+# Stages. Each one gets the outputs of its inputs (by stage name) and the run parameters.
+# ----------------------------------------------------------------------------------------------------
+
+def download(inputs, params):
+    '''
+        Same as the notebook: the Date index becomes a column, and the index runs from 0 to n.
+        With a csv_dir the ticker is read from <csv_dir>/<ticker>.csv instead of yfinance.
+    '''
+    if params.get('csv_dir'):
+        data = pd.read_csv(os.path.join(params['csv_dir'], f"{params['ticker']}.csv"),
+                           parse_dates=['Date'])
+    else:
+        import yfinance as yf
+        data = yf.download(params['ticker'], start=params['start'], end=params['end'], progress=False)
+        data['Date'] = data.index
+    data = data[['Date'] + PRICE_COLUMNS]
+    data.index = range(len(data))
+    return data
+
+
+def tidy_checks(inputs, params):
+    data = inputs['download']
+    return {'rows': len(data),
+            'missing': data.isnull().sum().to_dict(),
+            'duplicated_rows': int(data.duplicated(keep='first').sum())}
+
+
+def describe(inputs, params):
+    data = inputs['download'][PRICE_COLUMNS]
+    return {'describe': data.describe(),
+            'skewness': data.skew().round(3).to_dict(),
+            'kurtosis': data.kurtosis().round(3).to_dict()}
+
+
+def adf(inputs, params):
+    # Imported here, so the other stages still run on machines without statsmodels
+    from statsmodels.tsa.stattools import adfuller
+
+    result = {}
+    for column in PRICE_COLUMNS:
+        statistic, p_value = adfuller(inputs['download'][column])[:2]
+        result[column] = {'adf_statistic': float(statistic), 'p_value': float(p_value)}
+    return result
+
+
+def correlation(inputs, params):
+    return inputs['download'][PRICE_COLUMNS].corr()
+
+
+def make_growth_dataframe(data, columns=PRICE_COLUMNS):
+    '''
+        Vectorized version of make_growth_dataframe() in the notebook: percentage growth from the previous row,
+        rounded to two decimals. The first row, and any row after a zero, has a growth of 0.
+        Missing prices are not filled in, so they give a missing growth, like the notebook loop.
+    '''
+    prices = data[columns]
+    growth = prices.pct_change(fill_method=None) * 100
+    growth[prices.shift() == 0] = 0.0
+    growth.iloc[0] = 0.0
+    growth = growth.round(2)
+    growth.columns = [column + '_Growth' for column in columns]
+    return growth
+
+
+def growth(inputs, params):
+    data = inputs['download']
+    return pd.concat([data, make_growth_dataframe(data)], axis=1)
+
+
+def denoise(inputs, params):
+    '''
+        Same rule as denoising_the_data(): keep the rows within median +/- 5 robust standard deviations
+        (0.74 * interquartile range) of the chosen column.
+    '''
+    data = inputs['growth']
+    column = params['denoise_column']
+    quartiles = np.percentile(data[column], [25, 50, 75])
+    mu, sig = quartiles[1], 0.74 * (quartiles[2] - quartiles[0])
+    return data[(data[column] > mu - 5 * sig) & (data[column] < mu + 5 * sig)]
+
+
+def charts(inputs, params):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    out_dir = os.path.join(params['out_dir'], params['ticker'])
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+
+    for name, data in (('lines', inputs['growth']), ('lines_denoised', inputs['denoise'])):
+        fig, axes = plt.subplots(nrows=3, ncols=2, figsize=[16, 7])
+        fig.subplots_adjust(hspace=0.7)
+        axes = axes.ravel()
+        for i, column in enumerate(PRICE_COLUMNS):
+            axes[i].plot(data['Date'], data[column])
+            axes[i].set_title(f"{params['ticker']} {column}", fontweight='bold')
+            axes[i].axvline(data['Date'].loc[data[column].idxmin()], alpha=0.7, color='red')
+            axes[i].axvline(data['Date'].loc[data[column].idxmax()], alpha=0.7, color='purple')
+        path = os.path.join(out_dir, f'{name}.png')
+        fig.savefig(path)
+        plt.close(fig)
+        paths.append(path)
+    return paths
+
+
+STAGES = [
+    Stage('download', [], download, 1),
+    Stage('tidy_checks', ['download'], tidy_checks, 1),
+    Stage('describe', ['download'], describe, 1),
+    Stage('adf', ['download'], adf, 1),
+    Stage('correlation', ['download'], correlation, 1),
+    Stage('growth', ['download'], growth, 1),
+    Stage('denoise', ['growth'], denoise, 1),
+    Stage('charts', ['growth', 'denoise'], charts, 1, writes_files=True),
+]
+
+
+# ----------------------------------------------------------------------------------------------------
+# Checkpoints and shards
+# ----------------------------------------------------------------------------------------------------
+
+def stage_params(stage, params):
+    '''
+        Only the parameters a stage depends on go into its key. Otherwise changing e.g. the denoise column
+        would also invalidate the download checkpoint.
+    '''
+    if stage.name == 'download':
+        if params.get('csv_dir'):
+            return {'ticker': params['ticker'],
+                    'file_hash': file_hash(os.path.join(params['csv_dir'], f"{params['ticker']}.csv"))}
+        return {'ticker': params['ticker'], 'start': params['start'], 'end': params['end']}
+    if stage.name == 'denoise':
+        return {'denoise_column': params['denoise_column']}
+    if stage.name == 'charts':
+        return {'out_dir': params['out_dir'], 'ticker': params['ticker']}
+    return {}
+
+
+def stage_key(stage, params, input_hashes):
+    key = json.dumps({'stage': stage.name, 'version': stage.version,
+                      'params': stage_params(stage, params),
+                      'inputs': [input_hashes[name] for name in stage.inputs]},
+                     sort_keys=True, default=str)
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def load_checkpoint(path):
+    with open(path, 'rb') as file:
+        return pickle.load(file)
+
+
+def save_checkpoint(path, checkpoint):
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as file:
+        pickle.dump(checkpoint, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, path)
+
+
+def remove_stale_checkpoints(shard_dir, stage_name, keep):
+    '''
+        A stage has only one checkpoint worth keeping: the one just written. Older keys (other parameters,
+        a refreshed download, ...) would otherwise pile up night after night.
+    '''
+    for name in os.listdir(shard_dir):
+        path = os.path.join(shard_dir, name)
+        if name.endswith('.pkl') and name.rsplit('-', 1)[0] == stage_name and path != keep:
+            os.remove(path)
+
+
+def run_shard(ticker, params):
+    '''
+        Runs every stage for one ticker, in order. Returns a small, picklable record for the manifest.
+        The stage outputs themselves stay on disk, only their hashes travel back to the parent process.
+    '''
+    params = dict(params, ticker=ticker)
+    shard_dir = os.path.join(params['cache_dir'], ticker)
+    os.makedirs(shard_dir, exist_ok=True)
+
+    tracer = Tracer()
+    tracer.enable()
+    outputs, hashes, stages = {}, {}, {}
+    record = {'ticker': ticker, 'status': 'done', 'stages': stages, 'error': None}
+
+    for stage in STAGES:
+        try:
+            key = stage_key(stage, params, hashes)
+            path = os.path.join(shard_dir, f'{stage.name}-{key}.pkl')
+
+            with tracer.span(stage.name) as timing:
+                checkpoint = None
+                if os.path.exists(path) and stage.name not in params.get('refresh', ()):
+                    checkpoint = load_checkpoint(path)
+                    if stage.writes_files and not all(os.path.exists(file) for file in checkpoint['output']):
+                        checkpoint = None
+
+                if checkpoint is not None:
+                    stages[stage.name] = 'cached'
+                else:
+                    output = stage.function({name: outputs[name] for name in stage.inputs}, params)
+                    checkpoint = {'hash': content_hash(output), 'output': output}
+                    save_checkpoint(path, checkpoint)
+                    remove_stale_checkpoints(shard_dir, stage.name, path)
+                    stages[stage.name] = 'ran'
+                timing.rows = len(checkpoint['output']) if hasattr(checkpoint['output'], 'shape') else None
+
+            outputs[stage.name] = checkpoint['output']
+            hashes[stage.name] = checkpoint['hash']
+        except Exception:
+            stages[stage.name] = 'failed'
+            record.update(status='failed', failed_stage=stage.name, error=traceback.format_exc())
+            break
+
+    trace_dir = os.path.join(params['out_dir'], 'traces')
+    os.makedirs(trace_dir, exist_ok=True)
+    tracer.write_json(os.path.join(trace_dir, f'{ticker}.json'), ticker=ticker, status=record['status'])
+    return record
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def run_pipeline(tickers, params, workers=None, only_failed=False):
+    '''
+        Shards the universe by ticker over a process pool. The manifest is rewritten after every finished
+        shard, so even a killed run knows which tickers are done.
+    '''
+    os.makedirs(params['out_dir'], exist_ok=True)
+    manifest_path = os.path.join(params['out_dir'], 'manifest.json')
+    manifest = load_manifest(manifest_path)
+
+    if only_failed:
+        tickers = [ticker for ticker in tickers if manifest.get(ticker, {}).get('status') != 'done']
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_shard, ticker, params): ticker for ticker in tickers}
+        for future in as_completed(futures):
+            ticker = futures[future]
+            try:
+                record = future.result()
+            except Exception:
+                # The worker process itself died (e.g. out of memory)
+                record = {'ticker': ticker, 'status': 'failed', 'stages': {}, 'error': traceback.format_exc()}
+            record['finished_at'] = datetime.now().isoformat(timespec='seconds')
+            manifest[ticker] = record
+            save_manifest(manifest_path, manifest)
+            print(f"{ticker}: {record['status']} {record['stages']}")
+
+    return manifest
+
+
+def save_manifest(path, manifest):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temporary, path)
+
+
+def read_universe(args):
+    tickers = list(args.tickers or [])
+    if args.universe:
+        with open(args.universe) as file:
+            tickers += [line.strip() for line in file if line.strip() and not line.startswith('#')]
+    # Keep the order, drop duplicates
+    return list(dict.fromkeys(tickers))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the stock market analysis over a ticker universe')
+    parser.add_argument('--tickers', nargs='*', help='Tickers to analyze, e.g. BAC JPM C')
+    parser.add_argument('--universe', help='File with one ticker per line')
+    parser.add_argument('--start', default='2004-01-01')
+    parser.add_argument('--end', default='2016-01-01')
+    parser.add_argument('--csv-dir', help='Read <csv-dir>/<ticker>.csv instead of downloading from yfinance')
+    parser.add_argument('--denoise-column', default='Volume')
+    parser.add_argument('--cache-dir', default='.pipeline_cache')
+    parser.add_argument('--out-dir', default='pipeline_output')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--refresh', nargs='*', default=[],
+                        help='Stages to re-run even when checkpointed, e.g. --refresh download for fresh prices')
+    parser.add_argument('--only-failed', action='store_true',
+                        help='Only run tickers that are not marked as done in the manifest')
+    args = parser.parse_args()
+
+    tickers = read_universe(args)
+    if not tickers:
+        parser.error('No tickers given, use --tickers or --universe')
+
+    params = {'start': args.start, 'end': args.end, 'csv_dir': args.csv_dir,
+              'denoise_column': args.denoise_column, 'cache_dir': args.cache_dir,
+              'out_dir': args.out_dir, 'refresh': args.refresh}
+    manifest = run_pipeline(tickers, params, workers=args.workers, only_failed=args.only_failed)
+
+    failed = [ticker for ticker in tickers if manifest.get(ticker, {}).get('status') != 'done']
+    print(f'{len(tickers) - len(failed)} done, {len(failed)} failed' + (f": {' '.join(failed)}" if failed else ''))
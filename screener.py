@@ -0,0 +1,303 @@
+'''
+    Condition screener for the enriched stock data set (prices, volume, and *_Growth columns).
+
+    Every question in the notebook used to be answered by a fresh boolean scan over the whole table,
+    for example data.query(...) or dataset['Date'].dt.year == y. This module precomputes one sorted
+    index per column, so a range condition becomes two binary searches, which also tell how many rows
+    it matches. A conjunction starts from the condition that matches the fewest rows, and only those rows
+    are checked against the other conditions. A narrow screen never touches the rest of the table.
+
+    Example:
+        screener = Screener(dataset)
+        screener.row_ids('Volume_Growth > 50 and Close_Growth < -5 and Date between 2008 and 2010')
+'''
+
+import copy
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+# The row ids of a range come out of the index in value order. Up to this share of the table they are
+# put back in row order with np.sort, above it a boolean mask over every row is cheaper
+SORT_FRACTION = 1 / 32
+
+# How many bytes of per-condition row ids are kept around. Analysts tend to re-run the same clauses a lot
+CACHE_BYTES = 64 * 2**20
+
+OPERATORS = ('>=', '<=', '==', '>', '<', 'between')
+
+# One clause looks like:  Volume_Growth > 50  |  `Adj Close_Growth` <= -5  |  Date between 2008 and 2010
+CLAUSE_PATTERN = re.compile(
+    r'\s*(?:`(?P<quoted>[^`]+)`|(?P<column>[A-Za-z_][\w ]*?))\s*'
+    r'(?P<op>>=|<=|==|>|<|between)\s*'
+    r'(?P<value>[^\s]+)'
+    r'(?:\s+and\s+(?P<upper>(?!`)[^\s]+)(?=\s*$|\s+and\s))?'
+)
+AND_PATTERN = re.compile(r'\s+and\s+')
+
+
+def parse_conditions(text):
+    '''
+        This function turns a screen written by an analyst into a list of (column, operator, value) tuples.
+        Clauses are separated by 'and'. The 'between' operator also uses 'and' for its upper bound,
+        so the regex above takes the upper bound only when the clause really is a 'between'.
+
+        Column names with spaces (e.g. Adj Close_Growth) need to be wrapped in backticks,
+        the same way pandas' query() does it.
+    '''
+    conditions = []
+    position = 0
+    text = text.strip()
+
+    while position < len(text):
+        match = CLAUSE_PATTERN.match(text, position)
+        if match is None:
+            raise ValueError(f'Cannot parse the screen near: {text[position:]!r}')
+
+        column = match.group('quoted') or match.group('column').strip()
+        op = match.group('op')
+        if op == 'between':
+            if match.group('upper') is None:
+                raise ValueError(f'"between" needs two bounds: {match.group(0).strip()!r}')
+            value = (match.group('value'), match.group('upper'))
+        else:
+            value = match.group('value')
+        conditions.append((column, op, value))
+
+        # For the other operators a trailing 'and ...' belongs to the next clause
+        position = match.end() if op == 'between' else match.end('value')
+        separator = AND_PATTERN.match(text, position)
+        if separator is not None:
+            position = separator.end()
+        elif position < len(text):
+            raise ValueError(f'Expected "and" near: {text[position:]!r}')
+
+    return conditions
+
+
+class ColumnIndex:
+    '''
+        Sorted index of one column.
+
+        The values are sorted once (argsort). A range [low, high] is then found with two binary searches
+        and always maps to one contiguous slice of the sorted row ids, so the number of matching rows is
+        known before any of them is read. The unsorted values are kept too: checking a few given rows
+        against a range is cheaper by reading their values than by searching the index.
+
+        Missing values (NaN/NaT) are left out of the index, so no condition ever matches them.
+        That is also what a plain comparison like data['x'] > 50 does.
+    '''
+
+    def __init__(self, values, valid=None):
+        # valid marks the rows that are not missing, None when nothing is missing
+        self.values = values
+        self.valid = valid
+        if valid is None:
+            self.order = np.argsort(values, kind='stable')
+        else:
+            row_ids = np.flatnonzero(valid)
+            self.order = row_ids[np.argsort(values[row_ids], kind='stable')]
+        self.sorted_values = values[self.order]
+
+    def __len__(self):
+        return len(self.values)
+
+    def extended(self, values, valid=None):
+        '''
+            Index of the column with more rows appended at its end. Only the new values are sorted, and they
+            are merged into the sorted arrays at their binary search positions (np.insert), instead of
+            sorting the whole column again. This index is left as it is, screens can keep using it meanwhile.
+        '''
+        n_rows = len(self)
+        new_ids = np.arange(len(values)) if valid is None else np.flatnonzero(valid)
+        sort = np.argsort(values[new_ids], kind='stable')
+        new_ids = new_ids[sort]
+        new_values = values[new_ids]
+
+        index = copy.copy(self)
+        # Equal values keep the older rows first, like the stable argsort of the whole column would
+        positions = np.searchsorted(self.sorted_values, new_values, side='right')
+        dtype = np.result_type(self.sorted_values, new_values)
+        index.sorted_values = np.insert(self.sorted_values.astype(dtype, copy=False), positions, new_values)
+        index.order = np.insert(self.order, positions, n_rows + new_ids)
+        index.values = np.concatenate([self.values, values])
+        if self.valid is not None or valid is not None:
+            index.valid = np.concatenate([np.ones(n_rows, dtype=bool) if self.valid is None else self.valid,
+                                          np.ones(len(values), dtype=bool) if valid is None else valid])
+        return index
+
+    def positions(self, low=None, high=None, include_low=True, include_high=True):
+        # Two binary searches over the sorted values: the result is the slice [start, stop)
+        start = 0
+        stop = len(self.order)
+        if low is not None:
+            start = np.searchsorted(self.sorted_values, low, side='left' if include_low else 'right')
+        if high is not None:
+            stop = np.searchsorted(self.sorted_values, high, side='right' if include_high else 'left')
+        return int(start), int(max(start, stop))
+
+    def rows(self, start, stop):
+        # Row ids of a slice of the index, in row order
+        row_ids = self.order[start:stop]
+        if len(row_ids) < len(self) * SORT_FRACTION:
+            return np.sort(row_ids)
+        mask = np.zeros(len(self), dtype=bool)
+        mask[row_ids] = True
+        return np.flatnonzero(mask)
+
+    def matches(self, row_ids, **bounds):
+        # Which of the given rows are in the range
+        mask = in_range(self.values[row_ids], **bounds)
+        if self.valid is not None:
+            mask &= self.valid[row_ids]
+        return mask
+
+
+def in_range(values, low=None, high=None, include_low=True, include_high=True):
+    mask = np.ones(len(values), dtype=bool)
+    if low is not None:
+        mask &= (values >= low) if include_low else (values > low)
+    if high is not None:
+        mask &= (values <= high) if include_high else (values < high)
+    return mask
+
+
+class Screener:
+    '''
+        Screener over a data frame. Indexes are built lazily, the first time a column is screened,
+        and are kept for every screen afterwards.
+
+        One screener can be shared by several dashboard sessions, so the indexes and the row id cache
+        are only touched while holding a lock.
+    '''
+
+    def __init__(self, data):
+        self.data = data.reset_index(drop=True)
+        self.indexes = {}
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def column_values(self, frame, column):
+        if column not in frame.columns:
+            raise KeyError(f'Unknown column: {column!r}')
+        values = frame[column]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            return values.values.astype('datetime64[ns]').astype('int64')
+        return values.to_numpy()
+
+    def index(self, column):
+        if column not in self.indexes:
+            self.indexes[column] = ColumnIndex(*self.index_arrays(self.data, column))
+        return self.indexes[column]
+
+    def index_arrays(self, frame, column):
+        # The values to index, and which rows are not missing (None when none is)
+        valid = frame[column].notna().to_numpy()
+        return self.column_values(frame, column), None if valid.all() else valid
+
+    def coerce(self, column, value, upper=False):
+        '''
+            Screens are typed as text, so the bound needs to match the column type.
+            For the Date column, a bare year stands for the whole year: 'between 2008 and 2010'
+            means 2008-01-01 until 2010-12-31, which is how the notebook reads it. upper=True gives
+            the last moment of that year, otherwise it is the first one.
+        '''
+        dtype = self.data[column].dtype
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            text = str(value)
+            if re.fullmatch(r'\d{4}', text):
+                text = f'{text}-12-31 23:59:59.999999999' if upper else f'{text}-01-01'
+            return pd.Timestamp(text).value
+        if pd.api.types.is_numeric_dtype(dtype):
+            return float(value)
+        return str(value).strip('\'"')
+
+    def condition_bounds(self, column, op, value):
+        '''
+            Every operator is a range over the sorted values. The bounds come from coerce(), which
+            is where a bare year becomes its first (lower bound) or last (upper bound) moment.
+            E.g. 'Date > 2008' starts after 2008-12-31 and 'Date == 2008' is the whole of 2008.
+        '''
+        if op == 'between':
+            return dict(low=self.coerce(column, value[0]), high=self.coerce(column, value[1], upper=True))
+        if op == '==':
+            return dict(low=self.coerce(column, value), high=self.coerce(column, value, upper=True))
+        if op == '>':
+            return dict(low=self.coerce(column, value, upper=True), include_low=False)
+        if op == '>=':
+            return dict(low=self.coerce(column, value))
+        if op == '<':
+            return dict(high=self.coerce(column, value), include_high=False)
+        if op == '<=':
+            return dict(high=self.coerce(column, value, upper=True))
+        raise ValueError(f'Unknown operator: {op!r}, expected one of {OPERATORS}')
+
+    def parse(self, conditions):
+        # A screen string or a list of (column, operator, value) tuples, as hashable tuples
+        if isinstance(conditions, str):
+            return parse_conditions(conditions)
+        return [(column, op, tuple(value) if isinstance(value, list) else value) for column, op, value in conditions]
+
+    def condition_rows(self, column, op, value, start, stop):
+        # Row ids of the slice [start, stop) of the column index, cached per condition
+        key = (column, op, value)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+
+            row_ids = self.index(column).rows(start, stop)
+            # Handed out as is to every caller, so it must not be modified in place
+            row_ids.flags.writeable = False
+            self.cache[key] = row_ids
+            self.cache_bytes += row_ids.nbytes
+            while self.cache_bytes > CACHE_BYTES:
+                self.cache_bytes -= self.cache.popitem(last=False)[1].nbytes
+            return row_ids
+
+    def row_ids(self, conditions):
+        '''
+            Rows matching every condition, in row order. Conditions can be a screen string or a list of
+            (column, operator, value) tuples.
+
+            The binary searches give how many rows each condition matches. Only the most selective
+            condition is turned into row ids, and the other ones are checked on those rows alone,
+            from the most to the least selective, so the candidates shrink as fast as possible.
+        '''
+        conditions = self.parse(conditions)
+
+        # Held for the whole conjunction, so every condition is checked against the same rows
+        with self.lock:
+            if not conditions:
+                return np.arange(len(self.data))
+
+            plans = []
+            for column, op, value in conditions:
+                bounds = self.condition_bounds(column, op, value)
+                start, stop = self.index(column).positions(**bounds)
+                plans.append((stop - start, (column, op, value), bounds, start, stop))
+            plans.sort(key=lambda plan: plan[0])
+
+            _, condition, _, start, stop = plans[0]
+            row_ids = self.condition_rows(*condition, start, stop)
+            for _, (column, _, _), bounds, _, _ in plans[1:]:
+                if not len(row_ids):
+                    break
+                row_ids = row_ids[self.index(column).matches(row_ids, **bounds)]
+            return row_ids
+
+    def count(self, conditions):
+        return len(self.row_ids(conditions))
+
+    def select(self, conditions):
+        # Rows matching the screen, as a data frame
+        with self.lock:
+            return self.data.iloc[self.row_ids(conditions)]
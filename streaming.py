@@ -0,0 +1,462 @@
+'''
+    Streaming ingestion of new OHLCV bars.
+
+    The dashboard used to work on a static uploaded CSV only. This module runs an asyncio service that
+    consumes bars from a source, enriches them the same way the notebook does (the *_Growth columns),
+    and keeps everything else up to date incrementally:
+    1. Growth columns: only the previous bar of each ticker is needed, not the whole history
+    2. Range indexes: new rows are appended to a StreamingScreener, which scans a small tail
+       and merges it into its sorted indexes from time to time
+    3. Aggregates: count, mean, standard deviation, min and max (with their dates) are running values
+
+    Every batch of bars is pushed as a delta to each subscriber, so open dashboard sessions
+    can update their charts and metric cards without a full rerun.
+
+    Sources are async iterators of bars (dicts). Three are provided:
+    - replay_csv(): replays a CSV such as dataset_full.csv at a configurable speed (also used for testing)
+    - tail_csv(): follows a CSV file that another process appends to
+    - socket_lines(): listens on a local socket for JSON lines, one bar per line
+
+    Example (no external service needed):
+        service = IngestionService(replay_csv('dataset_full.csv', bars_per_second=50))
+        asyncio.run(service.run())
+'''
+
+import asyncio
+import csv
+import json
+import logging
+import math
+import queue
+import threading
+import weakref
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from screener import Screener, in_range
+
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+DEFAULT_TICKER = 'BAC'
+
+logger = logging.getLogger(__name__)
+
+
+def parse_bar(row, ticker=DEFAULT_TICKER):
+    '''
+        Turn one raw row (strings from a CSV or values from JSON) into a typed bar.
+        Only the date and the price/volume columns are kept, growth columns are always recomputed.
+    '''
+    date = pd.Timestamp(row['Date'])
+    # An empty date parses as NaT instead of failing
+    if pd.isna(date):
+        raise ValueError(f'Date is missing: {row["Date"]!r}')
+    bar = {'Ticker': row.get('Ticker') or ticker, 'Date': date.to_pydatetime()}
+    for column in PRICE_COLUMNS:
+        bar[column] = float(row[column])
+        # A single NaN would turn the running mean and standard deviation into NaN for good
+        if not math.isfinite(bar[column]):
+            raise ValueError(f'{column} is not a finite number: {row[column]!r}')
+    return bar
+
+
+def try_parse_bar(row, ticker=DEFAULT_TICKER, source='source'):
+    '''
+        parse_bar() for the sources: a malformed bar (missing column, empty or non-numeric value, bad date)
+        is logged and skipped, so one bad line does not stop the whole service. Returns None for those.
+    '''
+    try:
+        return parse_bar(row, ticker)
+    except (AttributeError, KeyError, TypeError, ValueError) as error:
+        logger.warning('Skipping a malformed bar from %s: %s (%r)', source, error, row)
+        return None
+
+
+async def replay_csv(path, bars_per_second=None, ticker=DEFAULT_TICKER):
+    '''
+        Replay a CSV file bar by bar. bars_per_second=None replays as fast as possible,
+        which is what tests and benchmarks want.
+    '''
+    delay = 1 / bars_per_second if bars_per_second else 0
+    with open(path, newline='') as file:
+        for row in csv.DictReader(file):
+            bar = try_parse_bar(row, ticker, path)
+            if bar is not None:
+                yield bar
+            # Sleeping 0 still gives the other tasks (subscribers, flushing) a turn
+            await asyncio.sleep(delay)
+
+
+async def tail_csv(path, poll_interval=1.0, from_start=False, ticker=DEFAULT_TICKER):
+    '''
+        Follow a CSV file like `tail -f`. The header is read first, then only rows appended
+        after the service started are yielded (unless from_start=True).
+    '''
+    with open(path, newline='') as file:
+        header = next(csv.reader([file.readline()]))
+        if not from_start:
+            file.seek(0, 2)
+
+        pending = ''
+        while True:
+            line = file.readline()
+            if not line:
+                await asyncio.sleep(poll_interval)
+                continue
+            # A line without a newline is still being written, wait for the rest of it
+            pending += line
+            if not pending.endswith('\n'):
+                continue
+            values = next(csv.reader([pending]))
+            pending = ''
+            bar = try_parse_bar(dict(zip(header, values)), ticker, path) if values else None
+            if bar is not None:
+                yield bar
+
+
+async def socket_lines(host='127.0.0.1', port=8765, ticker=DEFAULT_TICKER):
+    '''
+        Listen on a local socket. Each client sends one JSON bar per line, e.g.
+        {"Ticker": "BAC", "Date": "2016-01-04", "Open": 15.1, "High": ..., "Volume": 114888000}
+    '''
+    bars = asyncio.Queue()
+
+    async def handle_client(reader, writer):
+        async for line in reader:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                logger.warning('Skipping a line that is not JSON from %s:%s: %r', host, port, line)
+                continue
+            bar = try_parse_bar(row, ticker, f'{host}:{port}')
+            if bar is not None:
+                await bars.put(bar)
+        writer.close()
+
+    server = await asyncio.start_server(handle_client, host, port)
+    async with server:
+        while True:
+            yield await bars.get()
+
+
+class RunningStats:
+    '''
+        Running count, mean and standard deviation (Welford's algorithm) plus min and max with their dates.
+        The standard deviation uses n - 1 (Bessel correction), the same as pandas' std() in the dashboard.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.min_date = None
+        self.max = -math.inf
+        self.max_date = None
+
+    def update(self, value, date):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        # Strict comparisons keep the first date, like the dashboard's .iloc[0]
+        if value < self.min:
+            self.min, self.min_date = value, date
+        if value > self.max:
+            self.max, self.max_date = value, date
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+    def as_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'std': self.std,
+                'min': self.min, 'min_date': self.min_date,
+                'max': self.max, 'max_date': self.max_date}
+
+
+def growth(value, previous):
+    # Same rule as make_growth_dataframe() in the notebook: percentage, two decimals, 0 if undefined
+    if previous is None or previous == 0:
+        return 0.0
+    return round((value - previous) / previous * 100, 2)
+
+
+class StreamingScreener(Screener):
+    '''
+        Screener that also accepts new rows. Rows appended with extend() go into a small unindexed tail
+        first, and screens scan that tail directly (it is tiny compared to the archive). Once the tail grows
+        past tail_limit rows it is moved into the archive: its values are merged into the sorted indexes
+        already built (see ColumnIndex.extended()), so no column is sorted again.
+        This keeps appends cheap for streamed bars.
+    '''
+
+    def __init__(self, data, tail_limit=4096):
+        super().__init__(data)
+        self.tail = self.data.iloc[0:0]
+        self.tail_limit = tail_limit
+        # Only one extend() at a time. It holds the screener lock only to swap the merged archive in
+        self.extend_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data) + len(self.tail)
+
+    def extend(self, rows):
+        with self.extend_lock:
+            with self.lock:
+                self.tail = pd.concat([self.tail, rows], ignore_index=True)
+                if len(self.tail) < self.tail_limit:
+                    return
+                data, indexes = self.data, dict(self.indexes)
+
+            # The merge copies every indexed column, so screens carry on with the current archive,
+            # indexes and tail in the meantime. Nothing else can change them while extend_lock is held
+            merged = pd.concat([data, self.tail], ignore_index=True)
+            appended = merged.iloc[len(data):]
+            indexes = {column: index.extended(*self.index_arrays(appended, column))
+                       for column, index in indexes.items()}
+
+            with self.lock:
+                self.data = merged
+                self.tail = merged.iloc[0:0]
+                self.indexes = indexes
+                # Cached row ids do not have the merged rows
+                self.cache.clear()
+
+    def row_ids(self, conditions):
+        # The indexed rows come from the indexes, the tail is scanned. Cached row ids only cover
+        # the indexed rows, so they stay valid while the tail grows
+        conditions = self.parse(conditions)
+        with self.lock:
+            row_ids = super().row_ids(conditions)
+            if not len(self.tail):
+                return row_ids
+            mask = np.ones(len(self.tail), dtype=bool)
+            for column, op, value in conditions:
+                mask &= self.tail_mask(column, **self.condition_bounds(column, op, value))
+            return np.concatenate([row_ids, len(self.data) + np.flatnonzero(mask)])
+
+    def tail_mask(self, column, **bounds):
+        # Missing values never match, the same as in the index
+        return self.tail[column].notna().to_numpy() & in_range(self.column_values(self.tail, column), **bounds)
+
+    def frame(self):
+        # Archive rows first, then the appended tail, the same order the row ids use
+        with self.lock:
+            if not len(self.tail):
+                return self.data
+            return pd.concat([self.data, self.tail], ignore_index=True)
+
+    def select(self, conditions):
+        with self.lock:
+            return self.frame().iloc[self.row_ids(conditions)]
+
+
+class IngestionService:
+    '''
+        Consumes bars from a source and keeps growth columns, the screener's range indexes and the
+        running aggregates up to date. Bars are published to subscribers in batches (deltas):
+        a batch is flushed when it reaches batch_size bars, or when the source has been quiet for
+        flush_interval seconds, so a slow intraday feed still shows up right away.
+
+        history is an optional data frame (e.g. dataset_full.csv) the stream continues from.
+    '''
+
+    def __init__(self, source, history=None, batch_size=50, flush_interval=0.5, max_pending=1000):
+        self.source = source
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+
+        self.lock = threading.Lock()
+        # Held weakly: a closed dashboard session never unsubscribes, but once its session state is
+        # garbage collected its queue (and the deltas waiting in it) goes away on its own
+        self.subscribers = weakref.WeakSet()
+        self.last_bar = {}
+        self.aggregates = {}
+        self.screener = None
+        self.done = False
+        self.loop = None
+        self.task = None
+
+        if history is not None and len(history):
+            self.seed(history)
+
+    def seed(self, history):
+        history = history.copy()
+        if 'Ticker' not in history.columns:
+            history['Ticker'] = DEFAULT_TICKER
+        for bar in history.to_dict('records'):
+            self.enrich(bar, keep_growth=True)
+        self.screener = StreamingScreener(history)
+
+    def enrich(self, bar, keep_growth=False):
+        ticker = bar['Ticker']
+        previous = self.last_bar.get(ticker)
+        for column in PRICE_COLUMNS:
+            if not keep_growth:
+                bar[column + '_Growth'] = growth(bar[column], previous[column] if previous else None)
+            stats = self.aggregates.setdefault(ticker, {}).setdefault(column, RunningStats())
+            stats.update(bar[column], bar['Date'])
+        self.last_bar[ticker] = bar
+        return bar
+
+    def subscribe(self):
+        '''
+            Returns a thread-safe queue of deltas. Queues are thread-safe on purpose: Streamlit sessions
+            read them from their own script threads, while the service runs in its event loop.
+        '''
+        subscriber = queue.Queue(maxsize=self.max_pending)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def publish(self, delta):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(delta)
+            except queue.Full:
+                # A session that stopped reading should not stall the others, drop its oldest delta
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                subscriber.put_nowait(delta)
+
+    def flush(self, bars):
+        if not bars:
+            return
+        rows = pd.DataFrame(bars)
+        with self.lock:
+            screener = self.screener
+            if screener is None:
+                self.screener = StreamingScreener(rows)
+            tickers = rows['Ticker'].unique()
+            aggregates = {ticker: {column: stats.as_dict() for column, stats in self.aggregates[ticker].items()}
+                          for ticker in tickers}
+        # Outside the service lock: frame() and metrics() of the sessions do not wait for an index merge
+        if screener is not None:
+            screener.extend(rows)
+        self.publish({'rows': rows, 'aggregates': aggregates, 'n_rows': len(self.screener)})
+
+    async def run(self):
+        '''
+            The source is read by its own task into a queue. Waiting on that queue with a timeout is safe,
+            while a timeout directly on the source would cancel (and close) the async generator.
+        '''
+        bars = asyncio.Queue()
+        finished = object()
+
+        async def read_source():
+            try:
+                async for bar in self.source:
+                    await bars.put(bar)
+            finally:
+                await bars.put(finished)
+
+        reader = asyncio.create_task(read_source())
+        batch = []
+        try:
+            while True:
+                try:
+                    bar = await asyncio.wait_for(bars.get(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    self.flush(batch)
+                    batch = []
+                    continue
+                if bar is finished:
+                    break
+                with self.lock:
+                    batch.append(self.enrich(bar))
+                if len(batch) >= self.batch_size:
+                    self.flush(batch)
+                    batch = []
+            self.flush(batch)
+            # Surface errors raised by the source itself
+            await reader
+        finally:
+            reader.cancel()
+            self.done = True
+
+    def start_in_thread(self):
+        '''
+            Run the service in a background thread with its own event loop. This is how the
+            dashboard uses it, since Streamlit scripts are not async.
+        '''
+        self.loop = asyncio.new_event_loop()
+        self.task = self.loop.create_task(self.run())
+
+        def serve():
+            try:
+                self.loop.run_until_complete(self.task)
+            except asyncio.CancelledError:
+                pass
+            finally:
+                self.loop.close()
+
+        thread = threading.Thread(target=serve, daemon=True, name='stock-ingestion')
+        thread.start()
+        return thread
+
+    def stop(self):
+        # Cancel the run started by start_in_thread(), from any thread
+        if self.task is None or self.done:
+            return
+        try:
+            self.loop.call_soon_threadsafe(self.task.cancel)
+        except RuntimeError:
+            # The loop already finished and closed in the meantime
+            pass
+
+    def frame(self):
+        # Snapshot of everything ingested so far (history + streamed bars)
+        with self.lock:
+            if self.screener is None:
+                columns = {'Ticker': pd.Series(dtype=str), 'Date': pd.Series(dtype='datetime64[ns]')}
+                for column in PRICE_COLUMNS:
+                    columns[column] = pd.Series(dtype=float)
+                    columns[column + '_Growth'] = pd.Series(dtype=float)
+                return pd.DataFrame(columns)
+            return self.screener.frame()
+
+    def select(self, conditions):
+        # Rows ingested so far (history + streamed bars) that match a screen, see screener.py
+        with self.lock:
+            screener = self.screener
+        if screener is None:
+            return self.frame()
+        return screener.select(conditions)
+
+    def metrics(self, ticker, column):
+        with self.lock:
+            stats = self.aggregates.get(ticker, {}).get(column)
+            return stats.as_dict() if stats is not None else None
+
+
+if __name__ == '__main__':
+    # Quick local run: replay the archive and print each delta
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Replay a CSV through the ingestion service')
+    parser.add_argument('path', nargs='?', default='dataset_full.csv')
+    parser.add_argument('--bars-per-second', type=float, default=None)
+    args = parser.parse_args()
+
+    service = IngestionService(replay_csv(args.path, args.bars_per_second))
+    deltas = service.subscribe()
+    service.start_in_thread().join()
+    while not deltas.empty():
+        delta = deltas.get()
+        close = delta['aggregates'][DEFAULT_TICKER]['Close']
+        print(f"{datetime.now():%H:%M:%S} +{len(delta['rows'])} rows (total {delta['n_rows']}), "
+              f"close mean {close['mean']:.2f}, min {close['min']:.2f}, max {close['max']:.2f}")
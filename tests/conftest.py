@@ -0,0 +1,8 @@
+import pandas as pd
+import pytest
+
+
+@pytest.fixture(scope='session')
+def dataset():
+    # The enriched BAC data set the notebook produces. Read once, tests must not modify it
+    return pd.read_csv('dataset_full.csv', parse_dates=['Date'])
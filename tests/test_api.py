@@ -0,0 +1,104 @@
+import asyncio
+import json
+import threading
+
+import numpy as np
+import pyarrow as pa
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+from api import create_app, endpoint, load_dataset
+
+
+@pytest.fixture(scope='module')
+def datasets():
+    data = load_dataset('dataset_full.csv')
+    empty = data.copy()
+    empty['Close'] = np.nan
+    return {'BAC': data, 'EMPTY': empty}
+
+
+def fetch(datasets, path, params=None, headers=None):
+    async def run():
+        async with TestClient(TestServer(create_app(datasets))) as client:
+            first = await client.get(path, params=params, headers=headers)
+            return first.status, first.headers, await first.read()
+    return asyncio.run(run())
+
+
+def test_metrics_match_pandas(datasets):
+    status, _, body = fetch(datasets, '/metrics', {'column': 'Close', 'start': '2008-01-01', 'end': '2010-12-31'})
+    data = datasets['BAC']
+    selected = data[data['Date'].between('2008-01-01', '2010-12-31')]
+    assert status == 200
+    metrics = json.loads(body)[0]
+    assert metrics['rows'] == len(selected)
+    assert metrics['min'] == pytest.approx(selected['Close'].min())
+    assert metrics['std'] == pytest.approx(selected['Close'].std())
+    assert metrics['min_date'].startswith('2009-03-06')
+
+
+def test_etag_and_weak_validators(datasets):
+    async def run():
+        async with TestClient(TestServer(create_app(datasets))) as client:
+            first = await client.get('/summary')
+            etag = first.headers['ETag']
+            strong = await client.get('/summary', headers={'If-None-Match': etag})
+            weak = await client.get('/summary', headers={'If-None-Match': f'"other", W/{etag}'})
+            return strong.status, weak.status
+    assert asyncio.run(run()) == (304, 304)
+
+
+def test_arrow_series(datasets):
+    status, headers, body = fetch(datasets, '/series', {'column': 'Close_Growth', 'points': '10', 'format': 'arrow'})
+    assert status == 200
+    assert headers['Content-Type'] == 'application/vnd.apache.arrow.stream'
+    assert pa.ipc.open_stream(body).read_all().num_rows == 10
+
+
+@pytest.mark.parametrize('params', [
+    {'start': '2008-01-01'},
+    # Fewer rows than points, so no bucket is merged
+    {'start': '2008-01-02', 'end': '2008-01-15'},
+])
+def test_minmax_columns_do_not_depend_on_the_range(datasets, params):
+    status, _, body = fetch(datasets, '/series', dict(params, column='Close', how='minmax', points='20'))
+    rows = json.loads(body)
+    assert status == 200
+    assert set(rows[0]) == {'Date', 'min', 'max'}
+    assert len(rows) <= 20
+
+
+@pytest.mark.parametrize('path, params, status', [
+    ('/metrics', {}, 400),
+    ('/metrics', {'column': 'Nope'}, 404),
+    ('/metrics', {'column': 'Close', 'start': ''}, 400),
+    ('/metrics', {'column': 'Close', 'start': 'abc'}, 400),
+    ('/metrics', {'column': 'Close', 'start': '2030-01-01'}, 404),
+    ('/metrics', {'ticker': 'EMPTY', 'column': 'Close'}, 404),
+    ('/series', {'column': 'Close', 'points': 'x'}, 400),
+])
+def test_bad_requests(datasets, path, params, status):
+    assert fetch(datasets, path, params)[0] == status
+
+
+def test_misses_are_computed_off_the_event_loop(datasets):
+    threads = []
+
+    def compute(data, column, query):
+        threads.append(threading.current_thread())
+        return data.head(1)
+
+    async def run():
+        app = create_app(datasets)
+        app.router.add_get('/probe', endpoint(compute))
+        async with TestClient(TestServer(app)) as client:
+            response = await client.get('/probe')
+            return response.status
+    assert asyncio.run(run()) == 200
+    assert threads and threads[0] is not threading.main_thread()
+
+
+def test_app_needs_a_dataset():
+    with pytest.raises(ValueError):
+        create_app({})
@@ -0,0 +1,161 @@
+import json
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import instrumentation
+from instrumentation import NULL_SPAN, Tracer, traced
+
+
+@pytest.fixture
+def tracer():
+    tracer = Tracer()
+    tracer.enable()
+    yield tracer
+    tracer.disable()
+
+
+@pytest.fixture
+def module_tracer():
+    # traced() and span() go through the module tracer
+    instrumentation.tracer.reset()
+    instrumentation.enable()
+    yield instrumentation.tracer
+    instrumentation.disable()
+    instrumentation.tracer.reset()
+
+
+def test_nested_spans_are_recorded_inner_first(tracer):
+    with tracer.span('outer', rows=10):
+        with tracer.span('inner') as inner:
+            inner.rows = 3
+
+    inner, outer = tracer.records
+    assert (inner['name'], inner['depth'], inner['rows']) == ('inner', 1, 3)
+    assert (outer['name'], outer['depth'], outer['rows']) == ('outer', 0, 10)
+    assert outer['wall_ms'] >= inner['wall_ms'] >= 0
+    assert tracer.stack == []
+
+
+def test_errors_are_recorded_and_raised(tracer):
+    with pytest.raises(KeyError):
+        with tracer.span('lookup'):
+            {}['missing']
+    assert tracer.records[0]['error'] == 'KeyError'
+    assert tracer.stack == []
+
+
+def test_child_peak_is_part_of_the_parent_peak():
+    tracer = Tracer()
+    tracer.enable(memory=True)
+    try:
+        with tracer.span('outer'):
+            with tracer.span('inner'):
+                block = np.ones(8 * 2**20, dtype=np.uint8)
+                del block
+            # The inner span reset the global peak, the outer span still sees the 8MB
+            with tracer.span('after'):
+                pass
+    finally:
+        tracer.disable()
+
+    peaks = {record['name']: record['peak_kb'] for record in tracer.records}
+    assert peaks['inner'] >= 8 * 1024
+    assert peaks['outer'] >= 8 * 1024
+    assert peaks['after'] < 1024
+
+
+def test_overlapping_tracers_do_not_report_wrong_peaks():
+    first, second = Tracer(), Tracer()
+    first.enable(memory=True)
+    second.enable(memory=True)
+    try:
+        with first.span('big'):
+            block = np.ones(16 * 2**20, dtype=np.uint8)
+            del block
+            # A span of another session would reset the peak, so it is not measured at all
+            with second.span('other'):
+                pass
+        with second.span('after'):
+            pass
+    finally:
+        first.disable()
+        second.disable()
+
+    assert first.records[0]['peak_kb'] >= 16 * 1024
+    assert second.records[0]['peak_kb'] is None
+    assert second.records[1]['peak_kb'] is not None
+    assert second.summary()[0]['peak_kb'] is None
+
+
+def test_memory_tracking_is_reference_counted():
+    was_tracing = tracemalloc.is_tracing()
+    first, second = Tracer(), Tracer()
+    first.enable(memory=True)
+    second.enable(memory=True)
+    first.disable()
+    assert tracemalloc.is_tracing()
+    second.disable()
+    assert tracemalloc.is_tracing() == was_tracing
+
+    # A tracer that is never disabled releases tracemalloc when it is collected
+    third = Tracer()
+    third.enable(memory=True)
+    del third
+    assert tracemalloc.is_tracing() == was_tracing
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    with tracer.span('ignored') as current:
+        current.rows = 5
+    assert current is NULL_SPAN
+    assert NULL_SPAN.rows is None
+    assert tracer.records == []
+
+
+def test_traced_decorator_forms(module_tracer):
+    @traced
+    def bare():
+        return np.zeros((4, 2))
+
+    @traced('named')
+    def named():
+        return 'no shape'
+
+    assert bare().shape == (4, 2)
+    assert named() == 'no shape'
+    assert [(record['name'], record['rows']) for record in module_tracer.records] == [
+        ('test_traced_decorator_forms.<locals>.bare', 4),
+        ('named', None),
+    ]
+
+
+def test_traced_while_disabled():
+    @traced
+    def function():
+        return 1
+
+    assert function() == 1
+    assert instrumentation.tracer.records == []
+
+
+def test_summary_and_trace_json(tracer, tmp_path):
+    for rows in (10, 20):
+        with tracer.span('read_csv', rows=rows):
+            pass
+    with tracer.span('metrics'):
+        pass
+
+    read_csv, metrics = tracer.summary()
+    assert read_csv['name'] == 'read_csv' and read_csv['calls'] == 2 and read_csv['rows'] == 30
+    assert read_csv['max_wall_ms'] <= read_csv['wall_ms']
+    assert set(metrics) == {'name', 'calls', 'wall_ms', 'max_wall_ms', 'cpu_ms', 'rows'}
+
+    path = tracer.write_json(tmp_path / 'trace.json', source='test')
+    trace = json.loads(path.read_text())
+    assert set(trace) == {'created_at', 'pid', 'metadata', 'summary', 'spans'}
+    assert trace['metadata'] == {'source': 'test'}
+    assert len(trace['spans']) == 3
+    assert set(trace['spans'][0]) == {'name', 'depth', 'started_at', 'wall_ms', 'cpu_ms', 'rows', 'error'}
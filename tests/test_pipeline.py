@@ -0,0 +1,50 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from pipeline import PRICE_COLUMNS, make_growth_dataframe, run_shard
+
+
+def test_growth_matches_dataset():
+    dataset = pd.read_csv('dataset_full.csv')
+    growth = make_growth_dataframe(dataset)
+    for column in PRICE_COLUMNS:
+        assert np.allclose(growth[column + '_Growth'], dataset[column + '_Growth'])
+
+
+def test_growth_keeps_missing_prices_missing():
+    growth = make_growth_dataframe(pd.DataFrame({'x': [1.0, np.nan, 2.0, 0.0, 5.0]}), ['x'])
+    assert growth['x_Growth'].tolist()[0] == 0.0
+    assert growth['x_Growth'].isna().tolist() == [False, True, True, False, False]
+    # Growth after a zero price is 0, like the ZeroDivisionError branch of the notebook
+    assert growth['x_Growth'].tolist()[3:] == [-100.0, 0.0]
+
+
+def test_shard_resumes_and_cleans_up(tmp_path):
+    pytest.importorskip('statsmodels')
+    csv_dir = tmp_path / 'csv'
+    csv_dir.mkdir()
+    shutil.copy('dataset_full.csv', csv_dir / 'BAC.csv')
+    params = {'start': None, 'end': None, 'csv_dir': str(csv_dir), 'denoise_column': 'Volume',
+              'cache_dir': str(tmp_path / 'cache'), 'out_dir': str(tmp_path / 'out')}
+
+    first = run_shard('BAC', params)
+    assert first['status'] == 'done'
+    assert set(first['stages'].values()) == {'ran'}
+
+    # Changing a parameter only re-runs the stages that depend on it, and leaves one checkpoint per stage
+    second = run_shard('BAC', dict(params, denoise_column='Close'))
+    assert second['stages']['growth'] == 'cached'
+    assert second['stages']['denoise'] == 'ran'
+    checkpoints = os.listdir(tmp_path / 'cache' / 'BAC')
+    assert sorted(name.rsplit('-', 1)[0] for name in checkpoints) == sorted(second['stages'])
+
+    # Charts are drawn again when the output directory was cleaned
+    shutil.rmtree(tmp_path / 'out' / 'BAC')
+    third = run_shard('BAC', dict(params, denoise_column='Close'))
+    assert third['stages']['denoise'] == 'cached'
+    assert third['stages']['charts'] == 'ran'
+    assert os.path.exists(tmp_path / 'out' / 'BAC' / 'lines.png')
@@ -0,0 +1,82 @@
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from screener import Screener, parse_conditions
+
+
+@pytest.fixture(scope='module')
+def screener(dataset):
+    return Screener(dataset)
+
+
+@pytest.mark.parametrize('screen, scan', [
+    ('Volume_Growth > 50 and Close_Growth < -5 and Date between 2008 and 2010',
+     lambda d: (d['Volume_Growth'] > 50) & (d['Close_Growth'] < -5)
+               & (d['Date'] >= '2008-01-01') & (d['Date'] <= '2010-12-31')),
+    ('Close >= 10 and `Adj Close_Growth` <= -1', lambda d: (d['Close'] >= 10) & (d['Adj Close_Growth'] <= -1)),
+    ('Open == 39.875', lambda d: d['Open'] == 39.875),
+    ('Volume < 20000000', lambda d: d['Volume'] < 20000000),
+    ('High between 10 and 20', lambda d: d['High'].between(10, 20)),
+    ('Date == 2008', lambda d: d['Date'].dt.year == 2008),
+    ('Date > 2008', lambda d: d['Date'].dt.year > 2008),
+    ('Date >= 2008', lambda d: d['Date'].dt.year >= 2008),
+    ('Date < 2008', lambda d: d['Date'].dt.year < 2008),
+    ('Date <= 2008', lambda d: d['Date'].dt.year <= 2008),
+    ('Date > 2008-06-30', lambda d: d['Date'] > '2008-06-30'),
+])
+def test_row_ids_match_boolean_scan(dataset, screener, screen, scan):
+    assert np.array_equal(screener.row_ids(screen), np.flatnonzero(scan(dataset)))
+
+
+def test_list_conditions_and_empty_screen(dataset, screener):
+    row_ids = screener.row_ids([('Close', 'between', (10.0, 20.0))])
+    assert np.array_equal(row_ids, np.flatnonzero(dataset['Close'].between(10, 20)))
+    assert len(screener.row_ids([])) == len(dataset)
+
+
+def test_missing_values_never_match():
+    data = pd.DataFrame({'x': [1.0, np.nan, 100.0, np.nan]})
+    screener = Screener(data)
+    assert screener.row_ids('x > 50').tolist() == [2]
+    assert screener.row_ids('x < 50').tolist() == [0]
+    assert screener.row_ids('x >= 1').tolist() == [0, 2]
+
+    # Also when the column is not the most selective one, and is only checked on the candidate rows
+    data = pd.DataFrame({'x': [1.0, 2.0, 3.0, 4.0],
+                         'Date': pd.to_datetime(['2008-01-01', None, '2009-01-01', None])})
+    screener = Screener(data)
+    assert screener.row_ids('x > 1.5 and Date < 2010').tolist() == [2]
+
+
+def best_time(function, repeat=5):
+    function()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def test_warm_screen_beats_boolean_scan():
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame({'Volume_Growth': rng.normal(0, 20, 1_000_000),
+                         'Close_Growth': rng.normal(0, 3, 1_000_000)})
+    screener = Screener(data)
+    screen = 'Volume_Growth > 50 and Close_Growth < -5'
+    scan = lambda: data[(data['Volume_Growth'] > 50) & (data['Close_Growth'] < -5)]
+
+    assert screener.select(screen).equals(scan())
+    assert best_time(lambda: screener.select(screen)) < best_time(scan)
+
+
+def test_parse_conditions():
+    assert parse_conditions('Date between 2008 and 2010 and `Adj Close` > 5') == [
+        ('Date', 'between', ('2008', '2010')),
+        ('Adj Close', '>', '5'),
+    ]
+    with pytest.raises(ValueError):
+        parse_conditions('Close >')
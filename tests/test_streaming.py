@@ -0,0 +1,175 @@
+import asyncio
+import gc
+import json
+import socket
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from streaming import PRICE_COLUMNS, IngestionService, StreamingScreener, replay_csv, socket_lines, tail_csv
+
+
+@pytest.fixture(scope='module')
+def replayed():
+    # Replay as fast as possible: no external service, no sleeping
+    service = IngestionService(replay_csv('dataset_full.csv', bars_per_second=None), batch_size=100)
+    deltas = service.subscribe()
+    asyncio.run(service.run())
+    return service, deltas
+
+
+def test_growth_columns_match_dataset(dataset, replayed):
+    service, _ = replayed
+    frame = service.frame()
+    assert len(frame) == len(dataset)
+    for column in PRICE_COLUMNS:
+        assert np.allclose(frame[column + '_Growth'], dataset[column + '_Growth'])
+
+
+def test_running_stats_match_pandas(dataset, replayed):
+    service, _ = replayed
+    for column in PRICE_COLUMNS:
+        metrics = service.metrics('BAC', column)
+        assert metrics['count'] == len(dataset)
+        assert metrics['mean'] == pytest.approx(dataset[column].mean())
+        assert metrics['std'] == pytest.approx(dataset[column].std())
+        assert metrics['min'] == dataset[column].min()
+        assert metrics['max'] == dataset[column].max()
+        assert metrics['min_date'] == dataset['Date'].loc[dataset[column].idxmin()]
+        assert metrics['max_date'] == dataset['Date'].loc[dataset[column].idxmax()]
+
+
+def test_deltas_cover_every_row(dataset, replayed):
+    _, deltas = replayed
+    sizes = []
+    while not deltas.empty():
+        sizes.append(deltas.get_nowait())
+    assert sum(len(delta['rows']) for delta in sizes) == len(dataset)
+    assert sizes[-1]['n_rows'] == len(dataset)
+
+
+def test_screens_include_streamed_rows(dataset, replayed):
+    service, _ = replayed
+    screen = 'Volume_Growth > 50 and Close_Growth < -5 and Date between 2008 and 2010'
+    expected = ((dataset['Volume_Growth'] > 50) & (dataset['Close_Growth'] < -5)
+                & (dataset['Date'] >= '2008-01-01') & (dataset['Date'] <= '2010-12-31'))
+    assert np.array_equal(service.screener.row_ids(screen), np.flatnonzero(expected))
+    assert service.select(screen)['Date'].tolist() == dataset.loc[expected, 'Date'].tolist()
+
+
+def test_tail_matches_index():
+    data = pd.DataFrame({'x': [1.0, np.nan, 100.0, np.nan]})
+    screener = StreamingScreener(data)
+    assert screener.row_ids('x > 50').tolist() == [2]
+
+    # Rows still in the unindexed tail give the same answer as indexed rows, missing values included
+    screener.extend(data)
+    assert screener.row_ids('x > 50').tolist() == [2, 6]
+    assert len(screener.frame()) == 8
+
+
+
+def test_merged_indexes_match_a_full_sort(dataset):
+    screener = StreamingScreener(dataset.iloc[:1000], tail_limit=300)
+    screen = 'Volume_Growth > 20 and Close <= 15 and Date >= 2009'
+    screener.row_ids(screen)
+
+    for start in range(1000, len(dataset), 100):
+        screener.extend(dataset.iloc[start:start + 100])
+        expected = ((dataset['Volume_Growth'] > 20) & (dataset['Close'] <= 15)
+                    & (dataset['Date'] >= '2009-01-01')).iloc[:start + 100]
+        assert np.array_equal(screener.row_ids(screen), np.flatnonzero(expected))
+
+    # The merged indexes are the ones a fresh screener would build over the archive, ties in row order
+    assert len(screener.tail) and len(screener.data) > 1000
+    fresh = StreamingScreener(screener.data)
+    for column in ('Volume_Growth', 'Close', 'Date'):
+        merged, built = screener.index(column), fresh.index(column)
+        assert np.array_equal(merged.order, built.order)
+        assert np.array_equal(merged.sorted_values, built.sorted_values)
+
+
+def test_merge_keeps_missing_values_out():
+    data = pd.DataFrame({'x': [1.0, np.nan, 100.0]})
+    screener = StreamingScreener(data, tail_limit=2)
+    assert screener.row_ids('x < 50').tolist() == [0]
+    screener.extend(pd.DataFrame({'x': [np.nan, 2.0]}))
+    assert len(screener.tail) == 0
+    assert screener.row_ids('x < 50').tolist() == [0, 4]
+
+
+def test_dropped_subscriber_is_forgotten():
+    service = IngestionService(replay_csv('dataset_full.csv'))
+    deltas = service.subscribe()
+    assert len(service.subscribers) == 1
+    del deltas
+    gc.collect()
+    assert len(service.subscribers) == 0
+
+
+HEADER = 'Date,Open,High,Low,Close,Adj Close,Volume\n'
+
+
+async def ingest(service, n_rows, feed=None):
+    # Run the service until it has n_rows rows. feed() sends the bars once the service is running
+    task = asyncio.create_task(service.run())
+    try:
+        if feed is not None:
+            await feed()
+        async def filled():
+            while service.screener is None or len(service.screener) < n_rows:
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(filled(), timeout=5)
+        # Still running: the malformed bars did not stop it
+        assert not service.done
+    finally:
+        task.cancel()
+    return service.frame()
+
+
+def test_tail_csv_skips_malformed_rows(tmp_path, caplog):
+    path = tmp_path / 'bars.csv'
+    path.write_text(HEADER + '2016-01-04,15.1,15.2,14.9,15.0,14.0,100\n')
+
+    async def append():
+        with open(path, 'a') as file:
+            file.write('2016-01-05,15.0,,14.8,15.1,14.1,200\n')
+            file.write('not a date,15.0,15.1,14.8,15.1,14.1,200\n')
+            file.write('2016-01-06,15.2,15.4\n')
+            file.write('2016-01-07,15.2,15.4,15.0,15.3,14.3,300\n')
+
+    service = IngestionService(tail_csv(path, poll_interval=0.01, from_start=True), flush_interval=0.01)
+    frame = asyncio.run(ingest(service, 2, append))
+    assert frame['Date'].dt.strftime('%Y-%m-%d').tolist() == ['2016-01-04', '2016-01-07']
+    assert frame['Close_Growth'].tolist() == [0.0, 2.0]
+    assert sum('Skipping a malformed bar' in message for message in caplog.messages) == 3
+
+
+def test_socket_lines_skips_malformed_lines(caplog):
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    async def send():
+        for _ in range(100):
+            try:
+                _, writer = await asyncio.open_connection('127.0.0.1', port)
+                break
+            except OSError:
+                await asyncio.sleep(0.01)
+        bars = [{'Date': '2016-01-04', 'Open': 15.1, 'High': 15.2, 'Low': 14.9, 'Close': 15.0,
+                 'Adj Close': 14.0, 'Volume': 100},
+                {'Date': '2016-01-05', 'Close': 15.1},
+                {'Ticker': 'JPM', 'Date': '2016-01-05', 'Open': 60.1, 'High': 60.2, 'Low': 59.9, 'Close': 60.0,
+                 'Adj Close': 58.0, 'Volume': 500}]
+        lines = [json.dumps(bars[0]), '{not json', json.dumps(bars[1]), json.dumps(bars[2])]
+        writer.write(''.join(line + '\n' for line in lines).encode())
+        await writer.drain()
+        writer.close()
+
+    service = IngestionService(socket_lines('127.0.0.1', port), flush_interval=0.01)
+    frame = asyncio.run(ingest(service, 2, send))
+    assert frame['Ticker'].tolist() == ['BAC', 'JPM']
+    assert service.metrics('JPM', 'Close')['mean'] == 60.0
+    assert len(caplog.records) == 2